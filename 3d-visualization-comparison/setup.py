@@ -9,60 +9,121 @@ import sys
 import yaml
 import subprocess
 import time
+import random
 import argparse
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import json
 import base64
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Union
 import signal
+import functools
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+# Use the fastest JSON encoder installed for request bodies: orjson, then ujson,
+# then compact stdlib json
+try:
+    import orjson
+    _dumps = orjson.dumps
+except ImportError:
+    try:
+        import ujson
+
+        def _dumps(obj: Any) -> bytes:
+            return ujson.dumps(obj).encode('utf-8')
+    except ImportError:
+        def _dumps(obj: Any) -> bytes:
+            return json.dumps(obj, separators=(',', ':')).encode('utf-8')
+
+# Prefer the libyaml-backed loader when available, it is much faster than the pure Python one
+try:
+    from yaml import CSafeLoader as YamlLoader
+except ImportError:
+    from yaml import SafeLoader as YamlLoader
+
+# Only emit colors on an interactive terminal, and honor https://no-color.org
+_USE_COLOR = sys.stdout.isatty() and not os.environ.get("NO_COLOR")
+
+def _color(code: str) -> str:
+    """Return the ANSI escape code, or an empty string when colors are disabled"""
+    return code if _USE_COLOR else ''
 
 # ANSI color codes for terminal output
 class Colors:
-    HEADER = '\033[95m'
-    BLUE = '\033[94m'
-    GREEN = '\033[92m'
-    YELLOW = '\033[93m'
-    RED = '\033[91m'
-    ENDC = '\033[0m'
-    BOLD = '\033[1m'
-    UNDERLINE = '\033[4m'
+    HEADER = _color('\033[95m')
+    BLUE = _color('\033[94m')
+    GREEN = _color('\033[92m')
+    YELLOW = _color('\033[93m')
+    RED = _color('\033[91m')
+    ENDC = _color('\033[0m')
+    BOLD = _color('\033[1m')
+    UNDERLINE = _color('\033[4m')
+
+# Authentication header for the default Ditto credentials (ditto/ditto),
+# encoded once since the credentials never change
+_AUTH_HEADER = {"Authorization": "Basic " + base64.b64encode(b"ditto:ditto").decode('ascii')}
 
 # Digital Twin Management Functions
 def get_auth_header():
     """Get authentication header for Ditto API using default credentials"""
-    # Always use the default credentials: ditto/ditto
-    username = "ditto"
-    password = "ditto"
-    
-    auth_string = f"{username}:{password}"
-    auth_bytes = auth_string.encode('ascii')
-    auth_b64 = base64.b64encode(auth_bytes).decode('ascii')
-    
-    return {"Authorization": f"Basic {auth_b64}"}
+    # Return a copy so callers can't modify the shared constant
+    return dict(_AUTH_HEADER)
+
+def create_session(max_retries: Union[int, Retry] = 0) -> requests.Session:
+    """Create a pooled HTTP session preset with the Ditto JSON and auth headers"""
+    session = requests.Session()
+    session.mount("http://", HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=8,
+        max_retries=max_retries
+    ))
+    session.headers.update({
+        "Content-Type": "application/json",
+        **get_auth_header()
+    })
+    return session
+
+# Shared HTTP session for all Ditto API calls, so requests reuse one
+# keep-alive connection instead of opening a new socket per request
+SESSION = create_session(Retry(total=3, backoff_factor=0.2, status_forcelist=[502, 503, 504]))
+
+# Readiness probes don't retry internally, wait_for_ditto already polls with its own backoff
+PROBE_SESSION = create_session()
+
+# (connect, read) timeout used for Ditto API requests
+REQUEST_TIMEOUT = (3, 5)
+
+# (connect, read) timeout for readiness probes, short so a hung connect fails fast
+PROBE_TIMEOUT = (1, 2)
 
-def wait_for_ditto(ditto_url="http://localhost:8080", timeout=120, interval=5):
+# Minimum time in seconds between flushes of the wait_for_ditto progress dots
+PROGRESS_FLUSH_INTERVAL = 1.0
+
+def wait_for_ditto(ditto_url="http://localhost:8080", timeout=120, interval=5, initial_delay=0.25):
     """
     Wait for Ditto to become available by repeatedly checking its health endpoints
     
     Args:
         ditto_url: Base URL of the Ditto instance
         timeout: Maximum time to wait in seconds
-        interval: Time between checks in seconds
+        interval: Maximum time between checks in seconds
+        initial_delay: Time before the first retry in seconds, doubled after each check
     
     Returns:
         bool: True if Ditto becomes available, False if timeout is reached
     """
     print_step(f"Waiting for Ditto to become available (may take up to {timeout}s)")
     
-    auth_headers = get_auth_header()
-    headers = {
-        "Content-Type": "application/json",
-        **auth_headers
-    }
-    
-    # Use Ditto's API endpoint for health check
-    health_url = f"{ditto_url}/api/2/things"
-    start_time = time.time()
+    # Probe the Factory thing itself: GET /api/2/things without ids is answered by the
+    # search service, while a thing lookup goes through the things and policies services
+    # that creating the twin needs. 404 just means the twin doesn't exist yet.
+    health_url = f"{ditto_url}/api/2/things/{FACTORY_THING_ID}"
+    start_time = time.monotonic()
+    deadline = start_time + timeout
     
     # Initialize progress indicator
     sys.stdout.write("  Progress: ")
@@ -70,33 +131,38 @@ def wait_for_ditto(ditto_url="http://localhost:8080", timeout=120, interval=5):
     
     first_check = True
     dots_count = 0
+    last_flush = start_time
+    delay = initial_delay
     
-    while time.time() - start_time < timeout:
+    while time.monotonic() < deadline:
         try:
             # Show progress indicator
             if not first_check:
                 sys.stdout.write(".")
-                sys.stdout.flush()
                 dots_count += 1
                 
                 # Add elapsed time every 10 dots
                 if dots_count % 10 == 0:
-                    elapsed = int(time.time() - start_time)
+                    elapsed = int(time.monotonic() - start_time)
                     sys.stdout.write(f" {elapsed}s ")
+                
+                # Flush at most once per PROGRESS_FLUSH_INTERVAL, so the quick early
+                # probes share a flush while the later, slower ones still show up live
+                now = time.monotonic()
+                if now - last_flush >= PROGRESS_FLUSH_INTERVAL:
                     sys.stdout.flush()
+                    last_flush = now
             else:
                 first_check = False
             
             # Try to access the things API
-            response = requests.get(health_url, headers=headers, timeout=5)
+            response = PROBE_SESSION.get(health_url, timeout=PROBE_TIMEOUT)
             
-            if response.status_code == 200:
-                elapsed = int(time.time() - start_time)
+            if response.status_code in (200, 404):
+                elapsed = int(time.monotonic() - start_time)
                 sys.stdout.write(f" done ({elapsed}s)\n")
                 sys.stdout.flush()
                 print_success(f"Ditto is now available")
-                # Wait a bit more to ensure all services are fully initialized
-                time.sleep(2)
                 return True
                 
         except requests.exceptions.ConnectionError:
@@ -107,8 +173,12 @@ def wait_for_ditto(ditto_url="http://localhost:8080", timeout=120, interval=5):
             
         except requests.exceptions.RequestException:
             pass
-            
-        time.sleep(interval)
+        
+        # Exponential backoff with a little jitter so parallel clients don't poll in lockstep,
+        # never sleeping past the deadline
+        backoff = min(interval, delay + random.uniform(0, delay * 0.1))
+        time.sleep(max(0.0, min(backoff, deadline - time.monotonic())))
+        delay = min(interval, delay * 2)
     
     # Add a newline after the progress indicator
     sys.stdout.write("\n")
@@ -119,143 +189,190 @@ def wait_for_ditto(ditto_url="http://localhost:8080", timeout=120, interval=5):
     print_warning("Or try restarting with: ./setup.py restart")
     return False
 
+# Factory digital twin definition, fully static so it is built once at import
+FACTORY_THING_ID = "org.eclipse.ditto:Factory"
+FACTORY_MIXER_COUNT = 6
+
+# Each mixer has temperature and RPM, plus an alarm component
+FACTORY_FEATURES = {
+    f"Mixer_{i}": {"properties": {"Temperature": 100, "RPM": 60}}
+    for i in range(FACTORY_MIXER_COUNT)
+}
+FACTORY_FEATURES.update({
+    f"Mixer_{i}_AlarmComponent": {"properties": {"alarm_status": "NORMAL"}}
+    for i in range(FACTORY_MIXER_COUNT)
+})
+
+# Water tank with flow rate and tank volume (percentage)
+FACTORY_FEATURES["WaterTank"] = {
+    "properties": {
+        "flowRate1": 35,
+        "tankVolume1": 75
+    }
+}
+
+FACTORY_THING = {
+    "thingId": FACTORY_THING_ID,
+    "features": FACTORY_FEATURES
+}
+FACTORY_THING_JSON = _dumps(FACTORY_THING)
+
 def create_factory_digital_twin(ditto_url="http://localhost:8080"):
     """Create the Factory digital twin if it doesn't exist"""
-    thing_id = "org.eclipse.ditto:Factory"
-    url = f"{ditto_url}/api/2/things/{thing_id}"
+    url = f"{ditto_url}/api/2/things/{FACTORY_THING_ID}"
     
-    # Get authentication headers with default credentials
-    auth_headers = get_auth_header()
+    # "If-None-Match: *" makes Ditto only create the resource when it is missing
+    # and answer 412 otherwise, so no separate existence check is needed
+    create_only = {"If-None-Match": "*"}
     
-    headers = {
-        "Content-Type": "application/json",
-        **auth_headers
-    }
-    
-    # Check if thing exists
     try:
-        response = requests.get(url, headers=headers)
+        create_response = SESSION.put(url, data=FACTORY_THING_JSON, headers=create_only, timeout=REQUEST_TIMEOUT)
         
-        if response.status_code == 404:
-            # Thing doesn't exist, create it
-            print_step("Creating Factory digital twin...")
-            
-            # Create features for multiple mixers
-            features = {}
-            
-            # Add 6 mixers with properties
-            for i in range(6):
-                mixer_id = f"Mixer_{i}"
-                # Each mixer has temperature and RPM
-                features[mixer_id] = {
-                    "properties": {
-                        "Temperature": 100,
-                        "RPM": 60
-                    }
-                }
-                
-                # Each mixer also has an alarm component
-                features[f"{mixer_id}_AlarmComponent"] = {
-                    "properties": {
-                        "alarm_status": "NORMAL"
-                    }
-                }
-            
-            # Add water tank with flow rate and tank volume
-            features["WaterTank"] = {
-                "properties": {
-                    "flowRate1": 35,
-                    "tankVolume1": 75  # Added tank volume property (percentage)
-                }
-            }
-            
-            # Create the factory digital twin with all features
-            factory_thing = {
-                "thingId": thing_id,
-                "features": features
-            }
-            
-            create_response = requests.put(url, data=json.dumps(factory_thing), headers=headers)
-            
-            if create_response.status_code in (201, 204):
-                print_success(f"Successfully created Factory digital twin with 6 mixers and water tank")
-                return True
-            else:
-                print_error(f"Failed to create Factory digital twin: Status code {create_response.status_code}")
-                print(f"Response: {create_response.text}")
-                return False
-        elif response.status_code == 200:
+        if create_response.status_code in (201, 204):
+            print_success(f"Successfully created Factory digital twin with {FACTORY_MIXER_COUNT} mixers and water tank")
+            return True
+        elif create_response.status_code == 412:
             print_success("Factory digital twin already exists")
             
-            # Check if we need to update the water tank to add tankVolume1 property
+            # Add the tankVolume1 property to the water tank if an older twin lacks it
             water_tank_url = f"{url}/features/WaterTank/properties/tankVolume1"
-            tank_response = requests.get(water_tank_url, headers=headers)
-            
-            if tank_response.status_code == 404:
-                # Need to add tankVolume1 property
-                print_step("Adding tankVolume1 property to existing WaterTank...")
-                tank_update = requests.put(
-                    water_tank_url,
-                    data=json.dumps(75),  # Initial value of 75%
-                    headers=headers
-                )
-                if tank_update.status_code in (201, 204):
-                    print_success("Added tankVolume1 property to WaterTank")
-                else:
-                    print_warning(f"Could not add tankVolume1 property: Status code {tank_update.status_code}")
+            tank_update = SESSION.put(
+                water_tank_url,
+                data=_dumps(FACTORY_FEATURES["WaterTank"]["properties"]["tankVolume1"]),
+                headers=create_only,
+                timeout=REQUEST_TIMEOUT
+            )
+            if tank_update.status_code in (201, 204):
+                print_success("Added tankVolume1 property to WaterTank")
+            elif tank_update.status_code != 412:
+                print_warning(f"Could not add tankVolume1 property: Status code {tank_update.status_code}")
             
             return True
         else:
-            print_error(f"Error checking if Factory digital twin exists: Status code {response.status_code}")
-            print(f"Response: {response.text}")
+            print_error(f"Failed to create Factory digital twin: Status code {create_response.status_code}")
+            print(f"Response: {create_response.text}")
             return False
     except Exception as e:
-        print_error(f"Error checking if Factory digital twin exists: {str(e)}")
+        print_error(f"Error creating Factory digital twin: {str(e)}")
         return False
 
+# Message prefixes, built once so each print is a single concatenation
+_HEADER_PREFIX = "\n" + Colors.HEADER + Colors.BOLD + "= "
+_HEADER_SUFFIX = " =" + Colors.ENDC + "\n\n"
+_STEP_PREFIX = Colors.BLUE + "-> "
+_SUCCESS_PREFIX = Colors.GREEN + "✓ "
+_WARNING_PREFIX = Colors.YELLOW + "⚠ "
+_ERROR_PREFIX = Colors.RED + "✗ "
+_LINE_END = Colors.ENDC + "\n"
+
 def print_header(text: str) -> None:
     """Print a formatted header"""
-    print(f"\n{Colors.HEADER}{Colors.BOLD}= {text} ={Colors.ENDC}\n")
+    sys.stdout.write(_HEADER_PREFIX + text + _HEADER_SUFFIX)
 
 def print_step(text: str) -> None:
     """Print a formatted step"""
-    print(f"{Colors.BLUE}-> {text}{Colors.ENDC}")
+    sys.stdout.write(_STEP_PREFIX + text + _LINE_END)
 
 def print_success(text: str) -> None:
     """Print a success message"""
-    print(f"{Colors.GREEN}✓ {text}{Colors.ENDC}")
+    sys.stdout.write(_SUCCESS_PREFIX + text + _LINE_END)
 
 def print_warning(text: str) -> None:
     """Print a warning message"""
-    print(f"{Colors.YELLOW}⚠ {text}{Colors.ENDC}")
+    sys.stdout.write(_WARNING_PREFIX + text + _LINE_END)
 
 def print_error(text: str) -> None:
     """Print an error message"""
-    print(f"{Colors.RED}✗ {text}{Colors.ENDC}")
+    sys.stdout.write(_ERROR_PREFIX + text + _LINE_END)
+
+# Number of trailing stderr lines kept for failure reporting
+STDERR_TAIL_LINES = 200
 
-def run_command(command: str, shell: bool = True) -> tuple:
-    """Execute a shell command and return the result"""
+def run_command(command: str, shell: bool = True, stream: bool = True) -> tuple:
+    """
+    Execute a shell command and return the result
+    
+    With stream enabled, stdout is forwarded line by line as it arrives instead of
+    being buffered, and only the tail of stderr is kept for error reporting.
+    """
+    process = None
     try:
-        result = subprocess.run(
-            command, 
-            shell=shell, 
-            check=False, 
-            stdout=subprocess.PIPE, 
+        process = subprocess.Popen(
+            command,
+            shell=shell,
+            stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
-            text=True
+            text=True,
+            errors='replace',
+            bufsize=1
         )
-        return (result.returncode, result.stdout, result.stderr)
+        
+        # Drain stderr on a separate thread so neither pipe can fill up and block
+        stderr_tail = deque(maxlen=STDERR_TAIL_LINES)
+        stderr_reader = threading.Thread(target=stderr_tail.extend, args=(process.stderr,), daemon=True)
+        stderr_reader.start()
+        
+        stdout_lines = []
+        for line in process.stdout:
+            if stream:
+                sys.stdout.write(line)
+                sys.stdout.flush()
+            else:
+                stdout_lines.append(line)
+        
+        returncode = process.wait()
+        stderr_reader.join()
+        return (returncode, "".join(stdout_lines), "".join(stderr_tail))
     except Exception as e:
+        # Don't leave the child running if we stop reading its output
+        if process is not None:
+            process.kill()
+            process.wait()
         return (1, "", str(e))
 
+# Upper bound on concurrently running commands for steps marked 'parallel: true'
+MAX_PARALLEL_COMMANDS = 8
+
+def run_commands_sequentially(commands: List[str]):
+    """Run commands one after another, yielding each result as it completes"""
+    for command in commands:
+        print(f"  Running: {command}")
+        yield run_command(command)
+
+def run_commands_parallel(commands: List[str]) -> List[tuple]:
+    """
+    Run independent commands concurrently and return their results in order
+    
+    Output is captured per command and printed as one block once that command
+    finishes, so the output of concurrent commands doesn't interleave.
+    """
+    for command in commands:
+        print(f"  Running: {command}")
+    
+    results = [None] * len(commands)
+    with ThreadPoolExecutor(max_workers=min(MAX_PARALLEL_COMMANDS, len(commands))) as executor:
+        futures = {
+            executor.submit(run_command, command, stream=False): index
+            for index, command in enumerate(commands)
+        }
+        for future in as_completed(futures):
+            index = futures[future]
+            results[index] = future.result()
+            print(f"  Finished: {commands[index]}")
+            sys.stdout.write(results[index][1])
+    return results
+
 def execute_step(step_name: str, step_data: Dict[str, Any]) -> bool:
     """Execute a single setup step"""
     print_step(f"{step_data.get('description', step_name)}")
     
-    for command in step_data.get('commands', []):
-        print(f"  Running: {command}")
-        code, stdout, stderr = run_command(command)
-        
+    commands = step_data.get('commands', [])
+    if step_data.get('parallel') and len(commands) > 1:
+        results = run_commands_parallel(commands)
+    else:
+        results = run_commands_sequentially(commands)
+    
+    for code, stdout, stderr in results:
         if code != 0:
             print_error(step_data.get('failure_message', f"Command failed with exit code {code}"))
             print(f"  STDERR: {stderr}")
@@ -264,7 +381,7 @@ def execute_step(step_name: str, step_data: Dict[str, Any]) -> bool:
     # Run check command if provided
     check_command = step_data.get('check_command')
     if check_command:
-        code, stdout, stderr = run_command(check_command)
+        code, stdout, stderr = run_command(check_command, stream=False)
         if code != 0:
             print_warning("Check command failed, but continuing anyway...")
     
@@ -288,19 +405,23 @@ def execute_setup_phase(config: Dict[str, Any], phase: str) -> bool:
     print_success(f"Phase '{phase}' completed successfully")
     return True
 
+# Port used by the development server
+DEV_SERVER_PORT = 8000
+
 def start_dev_server() -> None:
     """Start the development server in the foreground"""
     print_header("Starting development server")
     print_step("Starting local development server for the visualization dashboard")
-    print("  Running: python -m http.server 8000")
+    print(f"  Serving {os.getcwd()} at http://localhost:{DEV_SERVER_PORT}/")
     print_warning("Press Ctrl+C to stop the server")
     
-    # Run the server in the foreground
-    try:
-        # Use os.system to keep the server in the foreground
-        os.system("python -m http.server 8000")
-    except KeyboardInterrupt:
-        print_warning("\nDevelopment server stopped by user")
+    # Serve in-process with one thread per request, so the dashboard's assets load concurrently
+    handler = functools.partial(SimpleHTTPRequestHandler, directory=os.getcwd())
+    with ThreadingHTTPServer(('', DEV_SERVER_PORT), handler) as server:
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            print_warning("\nDevelopment server stopped by user")
 
 def show_urls(config: Dict[str, Any]) -> None:
     """Display useful URLs defined in the configuration"""
@@ -334,6 +455,18 @@ def show_requirements(config: Dict[str, Any]) -> None:
     for req in requirements:
         print(f"  - {req}")
 
+# Actions that read setup.yaml, the others skip loading it
+CONFIG_ACTIONS = {'start', 'stop', 'restart', 'info'}
+
+def load_config(path: str) -> Dict[str, Any]:
+    """Load the configuration file, exiting on failure"""
+    try:
+        with open(path, 'rb') as f:
+            return yaml.load(f, Loader=YamlLoader)
+    except Exception as e:
+        print_error(f"Failed to load configuration file: {e}")
+        sys.exit(1)
+
 def main() -> None:
     """Main function"""
     # Parse command line arguments
@@ -347,13 +480,8 @@ def main() -> None:
     
     args = parser.parse_args()
     
-    # Load configuration file
-    try:
-        with open(args.config, 'r') as f:
-            config = yaml.safe_load(f)
-    except Exception as e:
-        print_error(f"Failed to load configuration file: {e}")
-        sys.exit(1)
+    # Load configuration file, only for actions that use it
+    config = load_config(args.config) if args.action in CONFIG_ACTIONS else None
     
     # Execute the requested action
     if args.action == 'create-twin':